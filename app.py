@@ -1,9 +1,47 @@
+import functools
+import hashlib
+import logging
 import os
 import re
-from collections import defaultdict 
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from flask import Flask, request, render_template, redirect, url_for, send_file, flash
+import numpy as np
 import pandas as pd
 
+# Prefer the Rust-backed calamine reader (pandas >= 2.2) when it is installed
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_ENGINE = "calamine"
+except ImportError:
+    EXCEL_ENGINE = "openpyxl"
+
+# Prefer xlsxwriter for writing results; it serializes rows without building an openpyxl workbook model
+try:
+    import xlsxwriter  # noqa: F401
+    EXCEL_WRITER_ENGINE = "xlsxwriter"
+except ImportError:
+    EXCEL_WRITER_ENGINE = "openpyxl"
+
+# Arrow-backed strings run str.contains/extract/findall on Arrow's compute kernels when pyarrow is installed
+try:
+    import pyarrow  # noqa: F401
+    STRING_DTYPE = "string[pyarrow]"
+except ImportError:
+    STRING_DTYPE = "string"
+
+# The parsed-upload cache is stored as parquet, so it is disabled when no parquet engine is installed
+try:
+    import pyarrow  # noqa: F401
+    PARQUET_ENGINE = "pyarrow"
+except ImportError:
+    try:
+        import fastparquet  # noqa: F401
+        PARQUET_ENGINE = "fastparquet"
+    except ImportError:
+        PARQUET_ENGINE = None
+
 # Flask app initialization
 app = Flask(__name__)
 app.secret_key = "supersecretkey"
@@ -13,16 +51,153 @@ UPLOAD_FOLDER = "uploads"
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
+CACHE_FOLDER = os.path.join(UPLOAD_FOLDER, "cache")  # Parsed uploads keyed by SHA-256 of their contents
+CACHE_MAX_ENTRIES = 256  # Oldest cache entries beyond this are evicted
 app.config["MAX_CONTENT_LENGTH"] = 100 * 1024 * 1024  # 100 MB
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # Copy uploads to disk in 1 MB chunks
+UPLOAD_WORKERS = 4  # Uploaded files processed in parallel per request
+
+# Precompiled patterns for extracting keys from transaction descriptions
+_MOBILE_UPI_RE = re.compile(r'([0-9]{10}@[a-z]+|[0-9]{10})')  # Mobile number or UPI ID
+_NAME_RE = re.compile(r'(?:NEFT|IMPS|RTGS).*?-([A-Za-z]+[A-Za-z ]+)-[A-Z0-9]{11}')  # NEFT/IMPS/RTGS name
+_UPI_RE = re.compile(r'(\d{10}@[a-zA-Z]+|[a-zA-Z]+@[a-zA-Z]+)')  # UPI ID pattern
+_NAME2_RE = re.compile(r'\b[A-Z][a-z]+\s[A-Z][a-z]+\b')  # Name pattern (First Last name)
+
+# Transaction categories and their description keywords, in match priority order ("Others" is the fallback)
+_CATEGORY_PATTERNS = [
+    ("UPI", re.compile("upi|paytm|google pay|phonepe", re.I)),
+    ("Card", re.compile("card|debit card|credit card", re.I)),
+    ("Withdrawal", re.compile("atm withdrawal|cash withdrawal", re.I)),
+    ("NEFT", re.compile("neft", re.I)),
+    ("IMPS", re.compile("imps", re.I)),
+    ("RTGS", re.compile("rtgs", re.I)),
+]
+
+# Utility function to compile a keyword list into one case-insensitive pattern
+@functools.lru_cache(maxsize=64)
+def _kw_regex(keywords):
+    """Compile a tuple of keywords into a case-insensitive alternation."""
+    return re.compile("|".join(map(re.escape, keywords)), re.I)
 
 # Utility function to detect a column based on keywords
 def detect_column(df, keywords):
     """Detect column by scanning all columns for keyword matches."""
-    for col in df.columns:
-        if any(keyword.lower() in col.lower() for keyword in keywords):
-            return col
-    return None
+    pattern = _kw_regex(tuple(keywords))
+    return next((col for col in df.columns if pattern.search(str(col))), None)
+
+# Utility function to save an uploaded file to disk
+def _save_upload(file_storage, dest):
+    """Stream an uploaded file to dest in large chunks and return the SHA-256 hex digest of its contents."""
+    digest = hashlib.sha256()
+    with open(dest, "wb") as out:
+        for chunk in iter(lambda: file_storage.stream.read(UPLOAD_CHUNK_SIZE), b""):
+            digest.update(chunk)
+            out.write(chunk)
+    return digest.hexdigest()
+
+# Utility function to process uploaded files in parallel
+def _map_uploads(process_one, files):
+    """Run process_one(file) -> (result, messages) over files in a thread pool and flash messages in upload order."""
+    # Files sharing a name stem would share temp and result paths (<stem>_totals.csv etc.), so process those one at a time
+    unique_names = len({os.path.splitext(file.filename)[0] for file in files}) == len(files)
+    max_workers = min(UPLOAD_WORKERS, len(files)) if unique_names else 1
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+        outcomes = list(executor.map(process_one, files))
+
+    results = []
+    for result, messages in outcomes:
+        for message, category in messages:
+            flash(message, category)
+        results.append(result)
+    return results
+
+# Utility function to load an uploaded Excel file
+def _read_excel(path, **kwargs):
+    """Read the first sheet of an Excel file with the fastest available engine."""
+    return pd.read_excel(path, engine=EXCEL_ENGINE, **kwargs)
+
+# Utility function to locate the cached parse of an upload
+def _cache_path(sha):
+    """Path of the parquet copy of the upload with the given SHA-256 digest."""
+    return os.path.join(CACHE_FOLDER, f"{sha}.parquet")
+
+# Utility function to bound the size of the parsed-file cache
+def _evict_cache():
+    """Remove the least recently used cache entries beyond CACHE_MAX_ENTRIES."""
+    entries = []
+    for entry in os.scandir(CACHE_FOLDER):
+        if entry.name.endswith((".parquet", ".nocache")):
+            try:
+                entries.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                continue  # Evicted by another request
+    for _, entry_path in sorted(entries)[:max(len(entries) - CACHE_MAX_ENTRIES, 0)]:
+        try:
+            os.remove(entry_path)
+        except FileNotFoundError:
+            pass
 
+# Utility function to load an uploaded Excel file through the parsed-file cache
+def _load_df(path, sha):
+    """Load an uploaded Excel file, reusing the cached parquet copy of an identical earlier upload."""
+    if PARQUET_ENGINE is None:
+        return _read_excel(path)
+
+    cache_path = _cache_path(sha)
+    try:
+        df = pd.read_parquet(cache_path, engine=PARQUET_ENGINE)
+        os.utime(cache_path)  # Mark as recently used for eviction
+        return df
+    except FileNotFoundError:
+        pass
+
+    df = _read_excel(path)
+
+    # Uploads that failed to cache before are marked so the conversion is not retried on every request
+    nocache_path = os.path.join(CACHE_FOLDER, f"{sha}.nocache")
+    if os.path.exists(nocache_path):
+        return df
+
+    # Best effort: skip caching if the sheet has columns parquet cannot store (e.g. mixed types)
+    os.makedirs(CACHE_FOLDER, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=CACHE_FOLDER, suffix=".tmp")
+    os.close(fd)
+    try:
+        df.to_parquet(tmp_path, engine=PARQUET_ENGINE, index=False)
+        os.replace(tmp_path, cache_path)
+    except Exception as e:
+        app.logger.info("Not caching %s: %s", path, e)
+        os.remove(tmp_path)
+        open(nocache_path, "w").close()
+    _evict_cache()
+    return df
+
+# Utility function to load only the detected columns of an Excel file
+def _read_excel_cols(path, keyword_groups, sha):
+    """Detect columns from the header row, then read only those columns. Returns (df, {group: column})."""
+    if PARQUET_ENGINE is not None and os.path.exists(_cache_path(sha)):
+        df = _load_df(path, sha)
+        return df, {name: detect_column(df, keywords) for name, keywords in keyword_groups.items()}
+
+    header = _read_excel(path, nrows=0)
+    cols = {name: detect_column(header, keywords) for name, keywords in keyword_groups.items()}
+    usecols = list(dict.fromkeys(col for col in cols.values() if col))
+    if not usecols:
+        return header, cols
+    return _read_excel(path, usecols=usecols), cols
+
+# Utility function to pick the result file format
+def _output_format():
+    """Return "xlsx" if the form explicitly asks for Excel output, otherwise "csv"."""
+    return "xlsx" if request.form.get("output_format", "").lower() == "xlsx" else "csv"
+
+# Utility function to save a result table
+def _write_table(df, output_path):
+    """Write df as Excel or CSV depending on the extension of output_path."""
+    if output_path.endswith(".xlsx"):
+        df.to_excel(output_path, index=False, engine=EXCEL_WRITER_ENGINE)
+    else:
+        df.to_csv(output_path, index=False)
 
 
 
@@ -31,37 +206,56 @@ def detect_column(df, keywords):
 def home():
     return render_template("index.html")
 
+# Utility function to run a per-description computation once per distinct value
+def _map_unique(text, func):
+    """Apply func to the distinct values of text only and broadcast its result back to every row."""
+    codes, uniques = pd.factorize(text, use_na_sentinel=False)
+    return func(pd.Series(uniques)).take(codes).set_axis(text.index)
+
+# Utility function to extract grouping keys from descriptions
+def _extract_description_keys(descriptions):
+    """Extracted mobile/UPI and NEFT/IMPS name for each description."""
+    keys = pd.DataFrame(index=descriptions.index)
+
+    # Extract mobile numbers or UPI IDs before '@'
+    keys['Extracted Mobile/UPI'] = descriptions.str.extract(_MOBILE_UPI_RE, expand=False)
+
+    # Extract names for NEFT/IMPS transactions
+    keys['Extracted Names'] = descriptions.str.extract(_NAME_RE, expand=False)
+    return keys
+
 # Route: Frequency Analysis
 @app.route("/frequency", methods=["POST"])
 def frequency_analysis():
     files = request.files.getlist("files")
+    output_format = _output_format()
     print(f"Files received: {[file.filename for file in files]}")  # Debugging
 
     if not files or all(file.filename == "" for file in files):
         flash("Please upload files for frequency analysis.", "error")
         return redirect(url_for("home"))
 
-    combined_data = []  # List to store data from all files
     result_files = []   # To store result filenames
 
-    for file in files:
+    def _process_one(file):
+        messages = []  # Flashed after all files are processed
         if file.filename == "":
-            flash("One of the files is empty. Skipping it.", "error")
-            continue
+            messages.append(("One of the files is empty. Skipping it.", "error"))
+            return None, messages
 
         try:
             # Save file temporarily
             temp_file_path = os.path.join(app.config["UPLOAD_FOLDER"], file.filename)
-            file.save(temp_file_path)
+            sha = _save_upload(file, temp_file_path)
 
             # Load the file using pandas
-            df = pd.read_excel(temp_file_path, engine="openpyxl")
+            df = _load_df(temp_file_path, sha)
 
             # Detect the description column dynamically
             desc_col = detect_column(df, ["description", "txn_desc", "narration", "particulars", "transaction details", "remarks"])
             if not desc_col:
-                flash(f"Description column not found in {file.filename}.", "error")
-                continue
+                messages.append((f"Description column not found in {file.filename}.", "error"))
+                return None, messages
 
             # Detect credit, debit, and amount columns dynamically
             credit_col = detect_column(df, ["credit", "deposit", "cr", "credit amount"])
@@ -69,50 +263,43 @@ def frequency_analysis():
             amount_col = detect_column(df, ["amount", "transaction amount", "transaction_amount"])
 
             # Standardize the description column for consistency
-            df[desc_col] = df[desc_col].astype(str).str.strip()
-
-            # Extract mobile numbers or UPI IDs before '@'
-            df['Extracted Mobile/UPI'] = df[desc_col].str.extract(r'([0-9]{10}@[a-z]+|[0-9]{10})', expand=False)
+            df[desc_col] = df[desc_col].astype(STRING_DTYPE).str.strip()
 
-            # Extract names for NEFT/IMPS transactions
-            df['Extracted Names'] = df[desc_col].str.extract(
-                r'(?:NEFT|IMPS|RTGS).*?-([A-Za-z]+[A-Za-z ]+)-[A-Z0-9]{11}', expand=False
-            )
+            # Extract mobile numbers/UPI IDs and NEFT/IMPS names once per distinct description
+            keys = _map_unique(df[desc_col], _extract_description_keys)
+            df[keys.columns] = keys
 
             # Combine extracted numbers and names for grouping
             df['Combined Key'] = df['Extracted Names'].combine_first(df['Extracted Mobile/UPI'])
 
-            # Add detection for payment methods (IMPS, NEFT, UPI, etc.)
-            payment_methods = ["UPI", "IMPS", "NEFT", "RTGS", "PAYTM", "BHIM", "PHONEPE"]
-            for method in payment_methods:
-                df[method] = df[desc_col].str.contains(method, case=False, na=False)
-
-            # Drop rows with no combined key
-            df = df.dropna(subset=['Combined Key'])
-
-            # Add the filename to identify the origin of data
-            df["Source File"] = file.filename
-
-            # Append relevant data to combined_data
-            combined_data.append(df[["Combined Key", "Source File"]])
+            # Return the keys of rows with a combined key, to be combined across files
+            return df['Combined Key'].dropna().to_numpy(), messages
 
         except Exception as e:
-            flash(f"Error processing {file.filename}: {e}", "error")
-            continue
+            messages.append((f"Error processing {file.filename}: {e}", "error"))
+            return None, messages
+
+    # Collect the keys from each file, with the filename to identify the origin of data
+    keys, sources = [], []
+    for file, file_keys in zip(files, _map_uploads(_process_one, files)):
+        if file_keys is not None:
+            keys.append(file_keys)
+            sources.append(np.full(len(file_keys), file.filename, dtype=object))
 
     # Combine all data across files
-    if combined_data:
-        combined_df = pd.concat(combined_data, ignore_index=True)
+    if keys:
+        combined_df = pd.DataFrame({"Combined Key": np.concatenate(keys), "Source File": np.concatenate(sources)})
 
-        # Count occurrences of each key across all files
+        # Count occurrences of each key across all files, and map the count back onto each row
         frequency_counts = combined_df["Combined Key"].value_counts()
+        frequency = combined_df["Combined Key"].map(frequency_counts)
 
         # Identify keys that appear in multiple files
         common_keys = frequency_counts[frequency_counts > 1]
         if not common_keys.empty:
             # Create a DataFrame for keys found in multiple files
-            common_data = combined_df[combined_df["Combined Key"].isin(common_keys.index)].copy()
-            common_data["Frequency"] = common_data["Combined Key"].map(frequency_counts)
+            is_common = frequency > 1
+            common_data = combined_df[is_common].assign(Frequency=frequency[is_common])
 
             # Identify if there’s exactly one common key across all files
             if len(common_keys) == 1:
@@ -122,9 +309,9 @@ def frequency_analysis():
                 flash(f"Multiple common keys were found across files.", "info")
 
             # Save the results to an output file
-            output_filename = "common_keys_analysis.xlsx"
+            output_filename = f"common_keys_analysis.{output_format}"
             output_path = os.path.join(app.config["UPLOAD_FOLDER"], output_filename)
-            common_data.to_excel(output_path, index=False, engine="openpyxl")
+            _write_table(common_data, output_path)
             result_files.append(output_filename)
         else:
             flash("No common keys found across the uploaded files.", "info")
@@ -139,6 +326,16 @@ def frequency_analysis():
 
 
 
+# Utility function to build the range filter mask
+def _range_mask(values, greater_than, less_than):
+    """Mask of values strictly between greater_than and less_than; a missing bound is left open."""
+    mask = np.ones(len(values), dtype=bool)
+    if greater_than is not None:
+        mask &= values > greater_than
+    if less_than is not None:
+        mask &= values < less_than
+    return mask
+
 ###
 # Route: Range Analysis (Greater Than / Lesser Than for Credit, Debit, or Both)
 @app.route("/range_analysis", methods=["POST"])
@@ -147,27 +344,29 @@ def range_analysis():
     greater_than = request.form.get("greater_than", type=float)
     less_than = request.form.get("less_than", type=float)
     transaction_type = request.form.get("transaction_type")  # "credit", "debit", or "both"
+    output_format = _output_format()
 
+    # At least one bound is required; a one-sided range filters on that bound alone
     if not files or (greater_than is None and less_than is None):
         flash("Please upload files and enter a valid range.", "error")
         return redirect(url_for("home"))
 
-    result_files = []
-    for file in files:
+    def _process_one(file):
+        messages = []  # Flashed after all files are processed
         try:
             temp_file_path = os.path.join(app.config["UPLOAD_FOLDER"], file.filename)
-            file.save(temp_file_path)
+            sha = _save_upload(file, temp_file_path)
 
             # Load the file
-            df = pd.read_excel(temp_file_path, engine="openpyxl")
+            df = _load_df(temp_file_path, sha)
 
             # Detect credit and debit columns dynamically
             credit_col = detect_column(df, ["credit", "deposit", "cr", "credit amount"])
             debit_col = detect_column(df, ["debit", "withdrawal", "dr", "debit amount"])
 
             if not credit_col and not debit_col:
-                flash(f"Credit or Debit columns not found in {file.filename}.", "error")
-                continue
+                messages.append((f"Credit or Debit columns not found in {file.filename}.", "error"))
+                return None, messages
 
             # Convert detected columns to numeric for filtering
             if credit_col:
@@ -175,35 +374,38 @@ def range_analysis():
             if debit_col:
                 df[debit_col] = pd.to_numeric(df[debit_col], errors="coerce").fillna(0)
 
-            # Apply filtering conditions based on user selection
-            filtered_df = df.copy()
-            if transaction_type == "credit" and credit_col:
-                filtered_df = df[(df[credit_col] > greater_than) & (df[credit_col] < less_than)]
-            elif transaction_type == "debit" and debit_col:
-                filtered_df = df[(df[debit_col] > greater_than) & (df[debit_col] < less_than)]
-            elif transaction_type == "both":
-                # Handle case where one of the columns is missing
-                if credit_col and debit_col:
-                    filtered_df = df[((df[credit_col] > greater_than) & (df[credit_col] < less_than)) | 
-                                     ((df[debit_col] > greater_than) & (df[debit_col] < less_than))]
-                elif credit_col:
-                    filtered_df = df[(df[credit_col] > greater_than) & (df[credit_col] < less_than)]
-                elif debit_col:
-                    filtered_df = df[(df[debit_col] > greater_than) & (df[debit_col] < less_than)]
-            
+            # Columns to filter on based on user selection; "both" handles a missing column
+            range_cols = {
+                "credit": [credit_col],
+                "debit": [debit_col],
+                "both": [credit_col, debit_col],
+            }.get(transaction_type, [])
+            range_cols = [col for col in range_cols if col]
+
+            # Apply filtering conditions as one boolean mask over the raw arrays
+            if range_cols:
+                mask = np.zeros(len(df), dtype=bool)
+                for col in range_cols:
+                    mask |= _range_mask(df[col].to_numpy(), greater_than, less_than)
+                filtered_df = df[mask]
+            else:
+                filtered_df = df.copy()
+
             if filtered_df.empty:
-                flash(f"No transactions found within the range in {file.filename}.", "info")
-                continue
+                messages.append((f"No transactions found within the range in {file.filename}.", "info"))
+                return None, messages
 
             # Save the filtered transactions
-            output_filename = f"{os.path.splitext(file.filename)[0]}_range_filtered.xlsx"
+            output_filename = f"{os.path.splitext(file.filename)[0]}_range_filtered.{output_format}"
             output_path = os.path.join(UPLOAD_FOLDER, output_filename)
-            filtered_df.to_excel(output_path, index=False, engine="openpyxl")
+            _write_table(filtered_df, output_path)
 
-            result_files.append(output_filename)
+            return output_filename, messages
         except Exception as e:
-            flash(f"Error processing {file.filename}: {e}", "error")
-            continue
+            messages.append((f"Error processing {file.filename}: {e}", "error"))
+            return None, messages
+
+    result_files = [name for name in _map_uploads(_process_one, files) if name]
 
     return render_template("result.html", result_files=result_files)
 
@@ -221,60 +423,52 @@ def range_analysis():
 def categorize_transactions():
     files = request.files.getlist("files")
     selected_categories = request.form.getlist("categories")
+    output_format = _output_format()
     if not files:
         flash("Please upload files to categorize.", "error")
         return redirect(url_for("home"))
 
-    result_files = []
-    for file in files:
+    # Patterns for the selected categories only
+    selected = set(selected_categories)
+    selected_patterns = [(category, pattern) for category, pattern in _CATEGORY_PATTERNS if category in selected]
+
+    def _process_one(file):
+        messages = []  # Flashed after all files are processed
         try:
             temp_file_path = os.path.join(app.config["UPLOAD_FOLDER"], file.filename)
-            file.save(temp_file_path)
+            sha = _save_upload(file, temp_file_path)
 
             # Load file
-            df = pd.read_excel(temp_file_path, engine="openpyxl")
+            df = _load_df(temp_file_path, sha)
 
             # Detect description-like column
             desc_col = detect_column(df, ["description", "details", "narration", "particulars"])
             if not desc_col:
-                flash(f"Description column not found in {file.filename}.", "error")
-                continue
-
-            # Define categories
-            categories = {
-                "UPI": ["upi", "paytm", "google pay", "phonepe"],
-                "Card": ["card", "debit card", "credit card"],
-                "Withdrawal": ["atm withdrawal", "cash withdrawal"],
-                "NEFT": ["neft"],
-                "IMPS": ["imps"],
-                "RTGS": ["rtgs"],
-                "Others": []
-            }
-
-            # Assign category based on description
-            def assign_category(description):
-                if pd.isna(description):
-                    return "Others"
-                desc = str(description).lower()
-                for category, keywords in categories.items():
-                    if category in selected_categories and any(keyword in desc for keyword in keywords):
-                        return category
-                return "Others"
-
-            df["Category"] = df[desc_col].apply(assign_category)
+                messages.append((f"Description column not found in {file.filename}.", "error"))
+                return None, messages
+
+            # Assign category based on description; the first matching category wins
+            desc = df[desc_col].astype(STRING_DTYPE)
+            if selected_patterns:
+                conds = [desc.str.contains(pattern, regex=True, na=False) for _, pattern in selected_patterns]
+                df["Category"] = np.select(conds, [category for category, _ in selected_patterns], default="Others")
+            else:
+                df["Category"] = "Others"
 
             # Filter data based on the selected categories
-            filtered_df = df[df["Category"].isin(selected_categories)]
+            filtered_df = df[df["Category"].isin(selected)]
 
             # Save result to file
-            output_filename = f"{os.path.splitext(file.filename)[0]}_categorized.xlsx"
+            output_filename = f"{os.path.splitext(file.filename)[0]}_categorized.{output_format}"
             output_path = os.path.join(UPLOAD_FOLDER, output_filename)
-            filtered_df.to_excel(output_path, index=False, engine="openpyxl")
+            _write_table(filtered_df, output_path)
 
-            result_files.append(output_filename)
+            return output_filename, messages
         except Exception as e:
-            flash(f"Error processing {file.filename}: {e}", "error")
-            continue
+            messages.append((f"Error processing {file.filename}: {e}", "error"))
+            return None, messages
+
+    result_files = [name for name in _map_uploads(_process_one, files) if name]
 
     return render_template("result.html", result_files=result_files)
 
@@ -286,23 +480,24 @@ def calculate_totals():
         flash("Please upload files for calculating totals.", "error")
         return redirect(url_for("home"))
 
-    result_files = []
-    for file in files:
+    output_format = _output_format()
+
+    def _process_one(file):
+        messages = []  # Flashed after all files are processed
         try:
             temp_file_path = os.path.join(app.config["UPLOAD_FOLDER"], file.filename)
-            file.save(temp_file_path)
+            sha = _save_upload(file, temp_file_path)
 
-
-            # Load file
-            df = pd.read_excel(temp_file_path, engine="openpyxl")
-
-            # Detect columns for deposits and withdrawals
-            credit_col = detect_column(df, ["credit", "deposits", "amount", "deposit"])
-            debit_col = detect_column(df, ["debit", "withdrawals", "amount", "withdrawal"])
+            # Detect columns for deposits and withdrawals, and load only those
+            df, cols = _read_excel_cols(temp_file_path, {
+                "credit": ["credit", "deposits", "amount", "deposit"],
+                "debit": ["debit", "withdrawals", "amount", "withdrawal"],
+            }, sha)
+            credit_col, debit_col = cols["credit"], cols["debit"]
 
             if not credit_col and not debit_col:
-                flash(f"Credit or debit columns not found in {file.filename}.", "error")
-                continue
+                messages.append((f"Credit or debit columns not found in {file.filename}.", "error"))
+                return None, messages
 
             # Ensure numeric conversion for calculations
             if credit_col:
@@ -323,14 +518,16 @@ def calculate_totals():
                 "Total Deposited (Credit)": [total_credit],
                 "Total Withdrawn (Debit)": [total_debit],
             })
-            output_filename = f"{os.path.splitext(file.filename)[0]}_totals.xlsx"
+            output_filename = f"{os.path.splitext(file.filename)[0]}_totals.{output_format}"
             output_path = os.path.join(app.config["UPLOAD_FOLDER"], output_filename)
-            totals_df.to_excel(output_path, index=False, engine="openpyxl")
+            _write_table(totals_df, output_path)
 
-            result_files.append(output_filename)
+            return output_filename, messages
         except Exception as e:
-            flash(f"Error processing {file.filename}: {e}", "error")
-            continue
+            messages.append((f"Error processing {file.filename}: {e}", "error"))
+            return None, messages
+
+    result_files = [name for name in _map_uploads(_process_one, files) if name]
 
     return render_template("result.html", result_files=result_files)
 
@@ -342,7 +539,6 @@ def calculate_totals():
 import os
 import pandas as pd
 from flask import Flask, request, send_from_directory, flash, redirect, url_for
-from collections import defaultdict
 import re
 
 app.config["UPLOAD_FOLDER"] = "uploads"  # Folder where files are temporarily saved
@@ -350,21 +546,19 @@ os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
 
 TRANSACTION_TYPES = ["UPI", "Card", "Cash Withdrawal", "NEFT", "IMPS", "RTGS"]
 
-def extract_names_and_upi(text):
-    """Extract UPI IDs, Names, and Transaction Types from transaction descriptions."""
-    upi_pattern = r'(\d{10}@[a-zA-Z]+|[a-zA-Z]+@[a-zA-Z]+)'  # UPI ID pattern
-    name_pattern = r'\b[A-Z][a-z]+\s[A-Z][a-z]+\b'  # Name pattern (First Last name)
-    
-    transaction_type = None
-    for ttype in TRANSACTION_TYPES:
-        if ttype.lower() in text.lower():  # Detect if transaction type is in the description
-            transaction_type = ttype
-            break
-    
-    upi_matches = re.findall(upi_pattern, text)
-    name_matches = re.findall(name_pattern, text)
-
-    return transaction_type, set(upi_matches + name_matches)
+def _extract_names_and_types(descriptions):
+    """Extract the set of UPI IDs/Names and the Transaction Type for each description."""
+    # Detect the first transaction type (in TRANSACTION_TYPES order) found in each description
+    transaction_type = np.select(
+        [descriptions.str.contains(ttype, case=False, regex=False) for ttype in TRANSACTION_TYPES],
+        TRANSACTION_TYPES,
+        default=None,
+    )
+
+    # Extract UPI IDs and names for the whole column at once
+    names = (descriptions.str.findall(_UPI_RE) + descriptions.str.findall(_NAME2_RE)).apply(set)
+
+    return pd.DataFrame({"Name": names, "Transaction Type": transaction_type}, index=descriptions.index)
 
 @app.route("/common_names", methods=["POST"])
 def common_names():
@@ -373,110 +567,103 @@ def common_names():
         flash("Please upload bank statements to find common names.", "error")
         return redirect(url_for("home"))
 
-    name_counts = defaultdict(int)
-    transaction_details = defaultdict(list)
-    full_transaction_data = []  # This will store the full transaction details for the additional sheet
+    output_format = _output_format()
+
     os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
 
+    # Build the long-form frame for one file: one row per (transaction, extracted name)
+    def _process_one(file):
+        messages = []  # Flashed after all files are processed
+        temp_file_path = os.path.join(app.config["UPLOAD_FOLDER"], file.filename)
+        sha = _save_upload(file, temp_file_path)
+        print(f"✔ File saved: {file.filename}")
+
+        df = _load_df(temp_file_path, sha)
+        print(f"✔ Loaded Excel file: {file.filename}, Columns: {list(df.columns)}")
+
+        description_columns = ["description", "narration", "particulars", "transaction details", "remarks"]
+        desc_col = next((col for col in df.columns if col.lower() in description_columns), None)
+
+        if not desc_col:
+            print(f"❌ No description column found in {file.filename}. Available columns: {list(df.columns)}")
+            messages.append((f"No description column found in {file.filename}.", "warning"))
+            return None, messages
+
+        print(f"✔ Found Description Column: {desc_col}")
+
+        amount_columns = ['amount', 'deposits', 'withdrawals', 'dr / cr', 'balance']
+        amount_col = next((col for col in df.columns if col.lower() in amount_columns), None)
+
+        if not amount_col:
+            print(f"❌ No amount column found in {file.filename}.")
+            messages.append((f"No amount column found in {file.filename}.", "warning"))
+            return None, messages
+
+        print(f"✔ Found Amount Column: {amount_col}")
+
+        text = df[desc_col].map(str).astype(STRING_DTYPE)  # Ensure it's a string
+
+        # Convert amount to numeric, coercing errors to NaN, and skip rows with no valid amount
+        amount = pd.to_numeric(df[amount_col], errors='coerce')
+        valid = amount.notna() & (amount != 0)
+        text, amount = text[valid], amount[valid]
+        app.logger.info("%s: %d of %d rows have a valid amount", file.filename, int(valid.sum()), len(df))
+
+        # Extract names and transaction types once per distinct description
+        extracted = _map_unique(text, _extract_names_and_types)
+
+        long_df = pd.DataFrame({
+            "Name": extracted["Name"],
+            "Transaction Type": extracted["Transaction Type"],
+            "Amount": amount,
+            "Description": text,
+            "File": file.filename
+        }).explode("Name").dropna(subset=["Name"])
+        return long_df, messages
+
     try:
         print(f"\n📂 Processing {len(files)} files...")
 
-        for file in files:
-            temp_file_path = os.path.join(app.config["UPLOAD_FOLDER"], file.filename)
-            file.save(temp_file_path)
-            print(f"✔ File saved: {file.filename}")
+        full_transaction_data = [data for data in _map_uploads(_process_one, files) if data is not None]
 
-            df = pd.read_excel(temp_file_path, engine="openpyxl")
-            print(f"✔ Loaded Excel file: {file.filename}, Columns: {list(df.columns)}")
+        full_transaction_df = pd.concat(full_transaction_data, ignore_index=True) if full_transaction_data else \
+            pd.DataFrame(columns=["Name", "Transaction Type", "Amount", "Description", "File"])
 
-            description_columns = ["description", "narration", "particulars", "transaction details", "remarks"]
-            desc_col = next((col for col in df.columns if col.lower() in description_columns), None)
+        name_counts = full_transaction_df["Name"].value_counts(sort=False)
+        common_names_list = name_counts[name_counts > 1]
+        app.logger.info("Common names found: %d", len(common_names_list))
+        if app.logger.isEnabledFor(logging.DEBUG):
+            app.logger.debug("Common Names List: %s", common_names_list.to_dict())
 
-            if not desc_col:
-                print(f"❌ No description column found in {file.filename}. Available columns: {list(df.columns)}")
-                flash(f"No description column found in {file.filename}.", "warning")
-                continue
-
-            print(f"✔ Found Description Column: {desc_col}")
-
-            amount_columns = ['amount', 'deposits', 'withdrawals', 'dr / cr', 'balance']
-            amount_col = next((col for col in df.columns if col.lower() in amount_columns), None)
-
-            if not amount_col:
-                print(f"❌ No amount column found in {file.filename}.")
-                flash(f"No amount column found in {file.filename}.", "warning")
-                continue
-
-            print(f"✔ Found Amount Column: {amount_col}")
-
-            for _, row in df.iterrows():
-                text = str(row[desc_col])  # Ensure it's a string
-                amount = row[amount_col]
-
-                # Convert amount to numeric, coercing errors to NaN
-                amount = pd.to_numeric(amount, errors='coerce')
-                print(f"Processing transaction: {text}, Amount: {amount}")
-
-                if pd.isna(amount) or amount == 0:
-                    print(f"❌ Skipping row with no valid amount in {file.filename}")
-                    continue
-
-                transaction_type, extracted_data = extract_names_and_upi(text)
-                print(f"Extracted Data: {extracted_data}, Transaction Type: {transaction_type}")
-
-                if extracted_data:
-                    for item in extracted_data:
-                        name_counts[item] += 1
-                        transaction_details[item].append({
-                            "Amount": amount,
-                            "Description": text,
-                            "Transaction Type": transaction_type,
-                            "File": file.filename
-                        })
-
-                        full_transaction_data.append({
-                            "Name": item,
-                            "Transaction Type": transaction_type,
-                            "Amount": amount,
-                            "Description": text,
-                            "File": file.filename
-                        })
-                else:
-                    print(f"❌ No valid data extracted for: {text}")
-
-        common_names_list = {name: count for name, count in name_counts.items() if count > 1}
-        print(f"Common Names List: {common_names_list}")
-
-        if not common_names_list:
+        if common_names_list.empty:
             print("⚠ No common names found, returning empty file.")
-            output_filename = "common_names_empty.xlsx"
+            output_filename = f"common_names_empty.{output_format}"
             output_path = os.path.join(app.config["UPLOAD_FOLDER"], output_filename)
-            pd.DataFrame(columns=["Common Name", "Frequency"]).to_excel(output_path, index=False, engine="openpyxl")
+            _write_table(pd.DataFrame(columns=["Common Name", "Frequency"]), output_path)
         else:
-            output_filename = "common_names.xlsx"
+            output_filename = "common_names.xlsx" if output_format == "xlsx" else "common_names.zip"
             common_df = pd.DataFrame(list(common_names_list.items()), columns=["Common Name", "Frequency"])
 
-            transaction_data = []
-            for name, transactions in transaction_details.items():
-                total_amount = sum([txn['Amount'] for txn in transactions if isinstance(txn['Amount'], (int, float))])
-                total_transactions = len(transactions)
-                transaction_types = set(txn['Transaction Type'] for txn in transactions)
-                
-                transaction_data.append({
-                    "Name": name,
-                    "Total Transactions": total_transactions,
-                    "Total Amount": total_amount,
-                    "Transaction Types": ", ".join([str(ttype) for ttype in transaction_types if ttype])
-                })
-            transaction_df = pd.DataFrame(transaction_data)
-
-            full_transaction_df = pd.DataFrame(full_transaction_data)
+            # Per-name totals for the common names, in a single group scan
+            common_transactions = full_transaction_df[full_transaction_df["Name"].isin(common_names_list.index)]
+            transaction_df = common_transactions.groupby("Name", sort=False).agg(**{
+                "Total Transactions": ("Amount", "size"),
+                "Total Amount": ("Amount", "sum"),
+                "Transaction Types": ("Transaction Type", lambda s: ", ".join(pd.unique(s.dropna()))),
+            }).reset_index()
 
             output_path = os.path.join(app.config["UPLOAD_FOLDER"], output_filename)
-            with pd.ExcelWriter(output_path, engine="openpyxl") as writer:
-                common_df.to_excel(writer, sheet_name="Common Names", index=False)
-                transaction_df.to_excel(writer, sheet_name="Transaction Details", index=False)
-                full_transaction_df.to_excel(writer, sheet_name="Full Transaction Details", index=False)
+            if output_format == "xlsx":
+                with pd.ExcelWriter(output_path, engine=EXCEL_WRITER_ENGINE) as writer:
+                    common_df.to_excel(writer, sheet_name="Common Names", index=False)
+                    transaction_df.to_excel(writer, sheet_name="Transaction Details", index=False)
+                    full_transaction_df.to_excel(writer, sheet_name="Full Transaction Details", index=False)
+            else:
+                # One CSV per sheet, bundled into a single download
+                with zipfile.ZipFile(output_path, "w", zipfile.ZIP_DEFLATED) as zf:
+                    zf.writestr("common_names.csv", common_df.to_csv(index=False))
+                    zf.writestr("transaction_details.csv", transaction_df.to_csv(index=False))
+                    zf.writestr("full_transaction_details.csv", full_transaction_df.to_csv(index=False))
 
         print(f"File ready for download: {output_filename}")
 
@@ -494,7 +681,8 @@ def common_names():
 @app.route("/download/<path:filename>")
 def download_file(filename):
     file_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-    return send_file(file_path, as_attachment=True)
+    # max_age=0 keeps browsers revalidating, since result filenames are reused when an analysis is re-run
+    return send_file(file_path, as_attachment=True, max_age=0)
 
 # Run the app
 if __name__ == "__main__":